@@ -4,12 +4,18 @@
 # Open: http://localhost:7860/client
 # =============================================================================
 
-import os
+import re
 import asyncio
 from loguru import logger
-from dotenv import load_dotenv
 
-from pipecat.frames.frames import LLMRunFrame, TextFrame
+from pipecat.frames.frames import (
+    InterruptionFrame,
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    LLMRunFrame,
+    TextFrame,
+    TTSSpeakFrame,
+)
 from pipecat.pipeline.pipeline import Pipeline
 from pipecat.pipeline.runner import PipelineRunner
 from pipecat.pipeline.task import PipelineTask
@@ -18,70 +24,299 @@ from pipecat.processors.aggregators.llm_response_universal import LLMContextAggr
 from pipecat.processors.frame_processor import FrameProcessor, FrameDirection
 from pipecat.runner.types import RunnerArguments
 from pipecat.runner.utils import create_transport
+from pipecat.utils.string import TextPartForConcatenation, concatenate_aggregated_text
 
-from providers import get_stt, get_tts, get_transport_params
-from db import init_db, get_user, save_user, update_session_count
-from onboarding import build_profile_from_onboarding
+from providers import get_llm, get_stt, get_tts, get_transport_params
+from db import init_db, close_db, get_user, save_user, stage_progress, flush_session
+from onboarding import ONBOARDING_GREETING, build_profile_from_onboarding
 from prompt_builder import build_prompt, get_onboarding_prompt
-from visual_extractor import extract_visuals, visual_channel
+from visual_extractor import VisualTagScanner, visual_channel
 from session_tracker import SessionTracker
-
-load_dotenv(override=True)
+from curriculum import preload_curricula
 
 FIXED_TEST_ID = "rohit-test-001"
 
-STRICT_PREFIX = """STRICT RULES — never break these:
-- NEVER write internal thoughts, tracking notes, or anything in brackets or asterisks.
-- NEVER mix two languages in one sentence.
-- Respond ONLY in the language the student is currently speaking.
-- You are Vidya, a teacher. Always stay in character.
-
-"""
-
-
-def make_llm(system_prompt: str):
-    from pipecat.services.google.llm import GoogleLLMService
-    return GoogleLLMService(
-        api_key=os.getenv("GOOGLE_API_KEY"),
-        model="gemini-2.5-flash",
-        system_instruction=STRICT_PREFIX + system_prompt,
-    )
+# Static context messages — built once at import, copied into each session
+ONBOARDING_MESSAGES = (
+    {"role": "system", "content": get_onboarding_prompt()},
+    {"role": "assistant", "content": ONBOARDING_GREETING},
+)
+RETURNING_KICKOFF = (
+    "Welcome back {name}! "
+    "You remember what was taught last session. "
+    "Start by briefly reviewing it, then begin today's lesson."
+)
+FIRST_LESSON_KICKOFF = (
+    "Onboarding complete. "
+    "Welcome {name} warmly and begin their very first lesson."
+)
+
+# Conversation window — once the context grows past MAX_CONTEXT_MESSAGES,
+# older turns are folded into one summary message and only the most recent
+# KEEP_RECENT_MESSAGES are sent verbatim. Keeps per-turn prefill bounded.
+MAX_CONTEXT_MESSAGES = 20
+KEEP_RECENT_MESSAGES = 10
+
+# The summary keeps one line per folded turn, for the last MAX_SUMMARY_LINES
+# turns, each clipped to MAX_SUMMARY_LINE_CHARS
+MAX_SUMMARY_LINES = 30
+MAX_SUMMARY_LINE_CHARS = 160
+
+
+# Characters that end a spoken phrase — "।" is the Devanagari full stop
+SENTENCE_END = re.compile(r"[.!?\n।]")
+
+
+# Frame dispatch — the processors below see every audio and control frame,
+# but only care about a handful of types. The kind for each concrete frame
+# class is worked out once (subclasses like LLMTextFrame included) and then
+# found with a single dict lookup.
+TEXT, RESPONSE_START, RESPONSE_END, INTERRUPTION = range(1, 5)
+_FRAME_KINDS = (
+    (TextFrame, TEXT),
+    (LLMFullResponseStartFrame, RESPONSE_START),
+    (LLMFullResponseEndFrame, RESPONSE_END),
+    (InterruptionFrame, INTERRUPTION),
+)
+_KIND_BY_TYPE: dict[type, int | None] = {}
+
+
+def frame_kind(frame) -> int | None:
+    """Returns TEXT, RESPONSE_START, RESPONSE_END, INTERRUPTION or None."""
+    cls = type(frame)
+    try:
+        return _KIND_BY_TYPE[cls]
+    except KeyError:
+        kind = next((k for t, k in _FRAME_KINDS if issubclass(cls, t)), None)
+        _KIND_BY_TYPE[cls] = kind
+        return kind
 
 
 class VisualSignalProcessor(FrameProcessor):
+    """
+    Strips [SHOW:x] tags from Vidya's speech and sends the visuals to the
+    browser. The LLM streams many tiny TextFrames, so tokens are collected
+    until a sentence ends and scanned once per sentence; TTS then gets
+    whole phrases too. Each cleaned sentence is also handed to the
+    SessionTracker for concept detection.
+    """
     def __init__(self, session_id: str, tracker: SessionTracker):
         super().__init__()
         self.session_id = session_id
         self.tracker = tracker
+        self._scanner = VisualTagScanner()
+        self._buf: list[str] = []
+
+    async def _flush(self):
+        if not self._buf:
+            return
+        text = "".join(self._buf)
+        self._buf.clear()
+        clean_text, asset_keys = self._scanner.feed(text)
+        for asset_key in asset_keys:
+            # Only queued here — the channel's writer task does the send
+            visual_channel.send_show(self.session_id, asset_key)
+            self.tracker.record_visual(asset_key)
+        if clean_text:
+            self.tracker.record_reply_text(clean_text)
+            await self.push_frame(TextFrame(clean_text))
+
+    def _reset(self):
+        self._buf.clear()
+        self.tracker.end_reply()
+        dropped = self._scanner.reset()
+        if dropped:
+            logger.debug("Dropping unterminated visual tag: {}", dropped)
+
+    async def process_frame(self, frame, direction):
+        await super().process_frame(frame, direction)
+        kind = frame_kind(frame)
+        if kind == TEXT and direction is FrameDirection.DOWNSTREAM:
+            self._buf.append(frame.text)
+            if SENTENCE_END.search(frame.text):
+                await self._flush()
+            return
+        if kind == RESPONSE_END:
+            await self._flush()
+            self._reset()
+        elif kind == RESPONSE_START or kind == INTERRUPTION:
+            self._reset()
+        await self.push_frame(frame, direction)
+
+
+class ExchangeTracker(FrameProcessor):
+    """
+    Sits just before the assistant context aggregator. Collects Vidya's
+    streamed text for one LLM response and, when the response ends,
+    records the whole turn in the SessionTracker and runs the
+    context-compaction check — once per turn rather than once per token.
+    Text arrives as TTSTextFrames, which often leave out the spaces
+    between words, so parts are joined the way the context aggregator
+    joins them.
+    """
+    def __init__(self, session: "StudentSession", tracker: SessionTracker,
+                 context: LLMContext, on_turn):
+        super().__init__()
+        self.session = session
+        self.tracker = tracker
+        self.context = context
+        self.on_turn = on_turn
+        self._parts: list[TextPartForConcatenation] = []
+
+    def _latest_user_text(self) -> str:
+        for message in reversed(self.context.get_messages()):
+            if message.get("role") == "user":
+                content = message.get("content")
+                return content if isinstance(content, str) else ""
+        return ""
 
     async def process_frame(self, frame, direction):
         await super().process_frame(frame, direction)
-        if isinstance(frame, TextFrame) and direction == FrameDirection.DOWNSTREAM:
-            clean_text, asset_keys = extract_visuals(frame.text)
-            for asset_key in asset_keys:
-                await visual_channel.send_show(self.session_id, asset_key)
-                self.tracker.record_visual(asset_key)
-            if clean_text != frame.text:
-                frame = TextFrame(clean_text)
+        if direction is FrameDirection.DOWNSTREAM:
+            kind = frame_kind(frame)
+            if kind == TEXT:
+                self._parts.append(TextPartForConcatenation(
+                    frame.text,
+                    includes_inter_part_spaces=frame.includes_inter_frame_spaces,
+                ))
+            elif kind == RESPONSE_START:
+                self._parts.clear()
+            elif kind == RESPONSE_END and self._parts:
+                self.session.last_user_text = self._latest_user_text()
+                self.session.last_vidya_text = concatenate_aggregated_text(self._parts)
+                self._parts.clear()
+                if self.session.last_user_text:
+                    self.tracker.record_exchange(
+                        self.session.last_user_text,
+                        self.session.last_vidya_text
+                    )
+                self.on_turn()
         await self.push_frame(frame, direction)
 
 
+_db_ready = False
+
+# Background DB writes — kept referenced so they are not garbage-collected
+# mid-flight, and awaited on disconnect so nothing is lost.
+_pending_writes: set[asyncio.Task] = set()
+
+
+def spawn_write(coro):
+    """Runs a DB write in the background, off the conversation path."""
+    task = asyncio.create_task(coro)
+    _pending_writes.add(task)
+    task.add_done_callback(_pending_writes.discard)
+    return task
+
+
+async def flush_writes():
+    """Waits for every background DB write to finish."""
+    if _pending_writes:
+        results = await asyncio.gather(*_pending_writes, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Background DB write failed: {result}")
+
+
+async def warmup():
+    """
+    One-time startup work that should never run on a student's connect.
+    Called from __main__ before the runner starts; bot() calls it too, but
+    after the first run it is a no-op.
+    """
+    global _db_ready
+    if not _db_ready:
+        await asyncio.gather(init_db(), asyncio.to_thread(preload_curricula))
+        _db_ready = True
+
+
+_SPEAKERS = {"user": "Student", "assistant": "Vidya"}
+
+
+def _clip(text: str) -> str:
+    """One line of summary — whitespace collapsed, long turns cut short."""
+    text = " ".join(text.split())
+    if len(text) <= MAX_SUMMARY_LINE_CHARS:
+        return text
+    return text[:MAX_SUMMARY_LINE_CHARS - 1] + "…"
+
+
+class BoundedHistory:
+    """
+    Keeps the conversation sent to the LLM bounded: the phase system
+    prompt, one rolling summary of this lesson's older turns, and the most
+    recent turns. Pipecat's LLMContext owns the live message list, so this
+    folds it back down once it passes max_messages rather than capping on
+    append.
+    """
+    __slots__ = ("system", "lines", "max_messages", "keep_recent")
+
+    def __init__(self, max_messages: int = MAX_CONTEXT_MESSAGES,
+                 keep_recent: int = KEEP_RECENT_MESSAGES):
+        self.system = None
+        self.lines: list[str] = []
+        self.max_messages = max_messages
+        self.keep_recent = keep_recent
+
+    def reset(self, system: dict):
+        """Starts a new phase — new system prompt, no summary yet."""
+        self.system = system
+        self.lines = []
+
+    def compact(self, messages: list, concepts) -> list | None:
+        """
+        Returns the compacted message list, or None if still within
+        bounds. The folded turns are condensed to one line each and kept
+        in the summary, with `concepts` (covered so far this lesson).
+        """
+        if len(messages) <= self.max_messages:
+            return None
+        # Start the kept window on a user turn so roles still alternate
+        start = len(messages) - self.keep_recent
+        while start < len(messages) and messages[start].get("role") != "user":
+            start += 1
+        # messages[1] is the previous summary once a fold has happened
+        for message in messages[2 if self.lines else 1:start]:
+            speaker = _SPEAKERS.get(message.get("role"))
+            content = message.get("content")
+            if speaker and isinstance(content, str):
+                self.lines.append(f"{speaker}: {_clip(content)}")
+        del self.lines[:-MAX_SUMMARY_LINES]
+        summary = "\n".join(self.lines)
+        covered = ", ".join(concepts)
+        if covered:
+            summary += f"\nConcepts covered so far: {covered}"
+        return [
+            self.system,
+            {"role": "system", "content": f"Earlier in this lesson:\n{summary}"},
+            *messages[start:],
+        ]
+
+
 class StudentSession:
+    __slots__ = (
+        "session_id", "user", "is_onboarding", "last_user_text",
+        "last_vidya_text", "history",
+    )
+
     def __init__(self, session_id: str):
         self.session_id = session_id
         self.user = None
         self.is_onboarding = False
         self.last_user_text = ""
         self.last_vidya_text = ""
+        self.history = BoundedHistory() # Phase prompt + rolling summary for compaction
 
 
 async def bot(runner_args: RunnerArguments):
 
-    await init_db()
-
-    transport = await create_transport(
-        runner_args,
-        {"webrtc": lambda: get_transport_params()},
+    # Transport setup and DB warmup are independent — run them together
+    transport, _ = await asyncio.gather(
+        create_transport(
+            runner_args,
+            {"webrtc": lambda: get_transport_params()},
+        ),
+        warmup(),
     )
 
     stt = get_stt()
@@ -91,80 +326,104 @@ async def bot(runner_args: RunnerArguments):
     tracker = SessionTracker(current_session.session_id)
 
     # ------------------------------------------------------------------
-    # LLM container — we use a list so inner functions can replace it
+    # One LLM for the whole connection. Onboarding → teaching only swaps
+    # the context messages; the service (and its HTTP client) is reused.
+    # The system prompt is always the first context message, and always
+    # starts with the stable prefix shared by every student.
     # ------------------------------------------------------------------
-    llm_container = [make_llm(get_onboarding_prompt())]
-
-    def get_current_llm():
-        return llm_container[0]
-
-    def swap_llm(new_prompt: str):
-        llm_container[0] = make_llm(new_prompt)
-        logger.info("LLM system prompt updated")
+    llm = get_llm()
+    logger.debug("LLM instance: {}", id(llm))
 
     visual_processor = VisualSignalProcessor(current_session.session_id, tracker)
 
     logger.info(f"Vidya Phase 5 ready | session: {current_session.session_id}")
 
-    messages = []
-    context = LLMContext(messages)
+    context = LLMContext()
     context_aggregator = LLMContextAggregatorPair(context)
 
+    # compact_history is defined below, with the other context helpers
+    exchange_tracker = ExchangeTracker(
+        current_session, tracker, context, lambda: compact_history()
+    )
+
     pipeline = Pipeline([
         transport.input(),
         stt,
         context_aggregator.user(),
-        llm_container[0],
+        llm,
         visual_processor,
         tts,
         transport.output(),
+        exchange_tracker,
         context_aggregator.assistant(),
     ])
 
     task = PipelineTask(pipeline)
 
+    async def set_context(opening: list[dict], first_frame):
+        """
+        Replaces the whole conversation with `opening` (one system prompt
+        plus one kickoff or greeting turn) and queues exactly one frame —
+        an LLMRunFrame, or a TTSSpeakFrame when the opening line is fixed.
+        Every phase change goes through here so no prompt is ever sent twice.
+        """
+        current_session.history.reset(opening[0])
+        context.set_messages(opening)
+        await task.queue_frames([first_frame])
+
+    def compact_history():
+        """
+        Folds older turns into a single summary message once the context
+        exceeds MAX_CONTEXT_MESSAGES. The phase system prompt is re-used
+        as-is, so the cached prompt prefix still matches.
+        The summary is built from the folded turns themselves — no extra
+        LLM call.
+        """
+        messages = context.get_messages()
+        compacted = current_session.history.compact(messages, tracker.concepts_taught)
+        if compacted is None:
+            return
+        # set_messages edits the live list in place, so count it first
+        before = len(messages)
+        context.set_messages(compacted)
+        logger.debug("Context compacted: {} → {} messages", before, len(compacted))
+
     async def start_teaching(user: dict, last_summary: str = None):
         current_session.is_onboarding = False
         current_session.user = user
-        teaching_prompt = build_prompt(user, last_session_summary=last_summary)
-        # Update system instruction on the existing LLM in-place
-        llm_container[0]._system_instruction = STRICT_PREFIX + teaching_prompt
-        messages.clear()
+        # Reads curriculum files — keep that I/O off the event loop
+        teaching_prompt = await asyncio.to_thread(build_prompt, user, last_summary)
         if last_summary:
-            messages.append({
-                "role": "user",
-                "content": (
-                    f"Welcome back {user['name']}! "
-                    f"You remember what was taught last session. "
-                    f"Start by briefly reviewing it, then begin today's lesson."
-                )
-            })
+            kickoff = RETURNING_KICKOFF.format(name=user["name"])
             logger.info(f"Returning student: {user['name']} | last session loaded")
         else:
-            messages.append({
-                "role": "user",
-                "content": (
-                    f"Onboarding complete. "
-                    f"Welcome {user['name']} warmly and begin their very first lesson."
-                )
-            })
+            kickoff = FIRST_LESSON_KICKOFF.format(name=user["name"])
             logger.info(f"First lesson for: {user['name']}")
-        await task.queue_frames([LLMRunFrame()])
+        await set_context(
+            [
+                {"role": "system", "content": teaching_prompt},
+                {"role": "user", "content": kickoff},
+            ],
+            LLMRunFrame(),
+        )
 
     async def start_onboarding():
         current_session.is_onboarding = True
-        messages.clear()
-        messages.append({"role": "user", "content": "Begin. Ask question 1."})
-        await task.queue_frames([LLMRunFrame()])
+        # Copies — the aggregators append to and may edit the live context.
+        # The greeting is already the assistant turn in ONBOARDING_MESSAGES,
+        # so speaking it must not append it a second time.
+        await set_context(
+            [dict(m) for m in ONBOARDING_MESSAGES],
+            TTSSpeakFrame(ONBOARDING_GREETING, append_to_context=False),
+        )
         logger.info("Onboarding started")
 
         async def auto_complete_onboarding():
             while current_session.is_onboarding:
                 await asyncio.sleep(3)
                 user_responses = [
-                    m for m in messages
+                    m for m in context.get_messages()
                     if m.get("role") == "user"
-                    and m.get("content") != "Begin. Ask question 1."
                 ]
                 if len(user_responses) >= 7:
                     logger.info("Onboarding complete — saving user")
@@ -174,7 +433,8 @@ async def bot(runner_args: RunnerArguments):
                         if 1 < len(m.get("content", "")) < 30
                     ]
                     name = name_candidates[0] if name_candidates else "Friend"
-                    profile = build_profile_from_onboarding(
+                    profile = await asyncio.to_thread(
+                        build_profile_from_onboarding,
                         current_session.session_id,
                         {
                             "name": name,
@@ -183,15 +443,16 @@ async def bot(runner_args: RunnerArguments):
                             "school_attended": "unknown",
                         }
                     )
-                    saved_user = await save_user(current_session.session_id, profile)
-                    await start_teaching(saved_user)
+                    spawn_write(save_user(current_session.session_id, profile))
+                    await start_teaching(profile)
                     break
 
         asyncio.create_task(auto_complete_onboarding())
 
     async def start_returning_session(user: dict):
         current_session.user = user
-        await update_session_count(current_session.session_id)
+        # Written with the rest of the session's progress on disconnect
+        stage_progress(current_session.session_id, sessions=1)
         last_summary = await tracker.load_last_summary()
         await start_teaching(user, last_summary)
 
@@ -204,41 +465,39 @@ async def bot(runner_args: RunnerArguments):
         else:
             await start_onboarding()
 
+    async def save_summary():
+        summary = await tracker.save()
+        logger.info(f"Session summary saved: {summary[:80]}...")
+
+    async def end_session():
+        """
+        Saves the session summary and tears the pipeline down. These don't
+        depend on each other, so they run together rather than one after
+        another.
+        """
+        jobs = [task.cancel()]
+        if current_session.user and not current_session.is_onboarding:
+            jobs.append(save_summary())     # also flushes staged progress
+        else:
+            jobs.append(flush_session(current_session.session_id))
+        for result in await asyncio.gather(*jobs, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"Session teardown step failed: {result}")
+
     @transport.event_handler("on_client_disconnected")
     async def on_client_disconnected(transport, client):
         name = current_session.user["name"] if current_session.user else "Unknown"
         logger.info(f"Student disconnected: {name}")
-        if current_session.user and not current_session.is_onboarding:
-            summary = await tracker.save()
-            logger.info(f"Session summary saved: {summary[:80]}...")
-        await visual_channel.send_hide(current_session.session_id)
-        await task.cancel()
+        visual_channel.send_hide(current_session.session_id)
+        await flush_writes()
+        await end_session()
 
     @transport.event_handler("on_client_closed")
     async def on_client_closed(transport, client):
         name = current_session.user["name"] if current_session.user else "Unknown"
         logger.info(f"Client closed: {name}")
-        if current_session.user and not current_session.is_onboarding:
-            summary = await tracker.save()
-            logger.info(f"Session summary saved: {summary[:80]}...")
-        await task.cancel()
-
-    original_assistant_push = context_aggregator.assistant().push_frame
-
-    async def tracked_assistant_push(frame, direction=None):
-        if isinstance(frame, TextFrame):
-            current_session.last_vidya_text = frame.text
-            if current_session.last_user_text:
-                tracker.record_exchange(
-                    current_session.last_user_text,
-                    current_session.last_vidya_text
-                )
-        if direction:
-            await original_assistant_push(frame, direction)
-        else:
-            await original_assistant_push(frame)
-
-    context_aggregator.assistant().push_frame = tracked_assistant_push
+        await flush_writes()
+        await end_session()
 
     runner = PipelineRunner(handle_sigint=runner_args.handle_sigint)
     await runner.run(task)
@@ -246,4 +505,8 @@ async def bot(runner_args: RunnerArguments):
 
 if __name__ == "__main__":
     from pipecat.runner.run import main
-    main()
+    asyncio.run(warmup())
+    try:
+        main()
+    finally:
+        asyncio.run(close_db())
@@ -6,18 +6,15 @@
 # Run: py -3.11 -m uvicorn backend:app --reload --port 8000
 # =============================================================================
 
-import os
 import uuid
 from loguru import logger
-from dotenv import load_dotenv
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, JSONResponse
 
+from config import GOOGLE_API_KEY, SARVAM_API_KEY
 from visual_extractor import visual_channel
 
-load_dotenv(override=True)
-
 app = FastAPI(title="Vidya Backend", version="4.0.0")
 
 
@@ -56,7 +53,7 @@ async def start_session():
     Called by browser when student clicks Start.
     Returns session_id for the WebSocket visual channel.
     """
-    session_id = str(uuid.uuid4())
+    session_id = uuid.uuid4().hex
     logger.info(f"New student session: {session_id}")
     return JSONResponse({
         "session_id": session_id,
@@ -71,8 +68,8 @@ async def health():
         "status": "ok",
         "service": "Vidya Backend",
         "phase": 4,
-        "sarvam_configured": bool(os.getenv("SARVAM_API_KEY")),
-        "google_configured": bool(os.getenv("GOOGLE_API_KEY")),
+        "sarvam_configured": bool(SARVAM_API_KEY),
+        "google_configured": bool(GOOGLE_API_KEY),
     }
 
 
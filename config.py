@@ -0,0 +1,19 @@
+# =============================================================================
+# config.py
+# Loads .env exactly once for the whole process.
+#
+# Every module that needs an API key reads it from here instead of calling
+# load_dotenv() itself. Python caches imported modules, so the .env file is
+# parsed once no matter how many modules import this.
+#
+# Usage:
+#   from config import GOOGLE_API_KEY, SARVAM_API_KEY
+# =============================================================================
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+SARVAM_API_KEY = os.getenv("SARVAM_API_KEY")
@@ -10,13 +10,23 @@
 # Usage:
 #   from curriculum import load_curriculum
 #   content = load_curriculum("literacy", 0)
+#
+# Files are cached in memory (re-read if their mtime changes);
+# preload_curricula() fills the cache at startup.
 # =============================================================================
 
 import os
+import re
 from loguru import logger
 
 CURRICULUM_DIR = os.path.join(os.path.dirname(__file__), "curriculum")
 
+# (subject, level) → (file mtime, content). The mtime check means an edited
+# .txt file is picked up on the next load without a restart.
+_CURR_CACHE: dict[tuple[str, int], tuple[float, str]] = {}
+
+_LEVEL_RE = re.compile(r"level(\d+)\.txt$")
+
 
 def load_curriculum(subject: str, level: int) -> str:
     """
@@ -46,13 +56,33 @@ def load_curriculum(subject: str, level: int) -> str:
         logger.error("No curriculum files found at all!")
         return "Teach basic literacy — letters A, E, I, O, U and numbers 1 to 5."
 
+    mtime = os.stat(path).st_mtime
+    key = (subject, level)
+    cached = _CURR_CACHE.get(key)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
     with open(path, "r", encoding="utf-8") as f:
         content = f.read().strip()
 
+    _CURR_CACHE[key] = (mtime, content)
     logger.info(f"Loaded curriculum: {subject}/level{level}")
     return content
 
 
+def preload_curricula() -> int:
+    """
+    Reads every curriculum file into the cache so no student's first
+    prompt waits on disk. Returns the number of files loaded.
+    """
+    count = 0
+    for subject in list_available_subjects():
+        for level in list_available_levels(subject):
+            load_curriculum(subject, level)
+            count += 1
+    return count
+
+
 def list_available_subjects() -> list:
     """Returns a list of all subjects that have curriculum files."""
     if not os.path.exists(CURRICULUM_DIR):
@@ -68,14 +98,12 @@ def list_available_levels(subject: str) -> list:
     subject_dir = os.path.join(CURRICULUM_DIR, subject)
     if not os.path.exists(subject_dir):
         return []
-    levels = []
-    for f in os.listdir(subject_dir):
-        if f.startswith("level") and f.endswith(".txt"):
-            try:
-                level_num = int(f.replace("level", "").replace(".txt", ""))
-                levels.append(level_num)
-            except ValueError:
-                pass
+    with os.scandir(subject_dir) as entries:
+        levels = [
+            int(m.group(1))
+            for m in (_LEVEL_RE.match(e.name) for e in entries if e.is_file())
+            if m
+        ]
     return sorted(levels)
 
 
@@ -9,13 +9,176 @@
 #   from db import init_db, get_user, save_user, update_progress
 # =============================================================================
 
-import json
+import time
+import orjson
+import asyncio
+from contextlib import asynccontextmanager
 import aiosqlite
 from loguru import logger
-from datetime import datetime
 
 DB_PATH = "vidya.db"
 
+# One long-lived connection for the whole process — see get_db()
+_db: aiosqlite.Connection | None = None
+
+# Serialises transactions on the shared connection — see write_batch()
+_write_lock = asyncio.Lock()
+
+# Recently loaded profiles: session_id → (loaded_at, user). Write helpers
+# drop the entry for the student they touch, and the TTL bounds how stale
+# anything written from outside this process can get.
+USER_CACHE_TTL = 30.0
+USER_CACHE_MAX = 1024
+_user_cache: dict[str, tuple[float, dict]] = {}
+
+
+# =============================================================================
+# SQL statements
+# Kept as module constants so every call sends byte-identical SQL text —
+# sqlite3's per-connection statement cache then reuses the prepared
+# statement instead of parsing and planning it again.
+# =============================================================================
+
+# Local-time ISO timestamp, generated by SQLite at write time. %f gives
+# milliseconds (2026-01-01T09:30:00.123); rows written before SQLite took
+# over the stamping carry microseconds. SessionTracker.started_at uses the
+# same millisecond precision, so both ends of a sessions row match.
+_NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')"
+
+_SELECT_USER_SQL = """
+    SELECT id, session_id, name, preferred_language, literacy_level,
+           numeracy_level, school_attended, learning_goal, learning_path,
+           current_subject, current_level, topics_completed, quiz_scores,
+           total_stars, session_count, last_seen, created_at, onboarding_done
+    FROM users WHERE session_id = ?
+"""
+
+_INSERT_USER_SQL = f"""
+    INSERT OR REPLACE INTO users (
+        session_id, name, preferred_language, literacy_level,
+        numeracy_level, school_attended, learning_goal,
+        learning_path, current_subject, current_level,
+        session_count, last_seen, created_at, onboarding_done
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, {_NOW_SQL}, {_NOW_SQL}, ?)
+    RETURNING id, created_at
+"""
+
+_TOUCH_SESSION_SQL = f"""
+    UPDATE users
+    SET session_count = session_count + 1,
+        last_seen = {_NOW_SQL}
+    WHERE session_id = ?
+"""
+
+_ADD_STARS_SQL = """
+    UPDATE users
+    SET total_stars = total_stars + ?
+    WHERE session_id = ?
+"""
+
+# Appends one topic to users.topics_completed inside SQLite, unless present
+_APPEND_TOPIC_SQL = """
+    UPDATE users
+    SET topics_completed = json_insert(COALESCE(topics_completed, '[]'), '$[#]', ?)
+    WHERE session_id = ?
+      AND NOT EXISTS (
+          SELECT 1 FROM json_each(users.topics_completed) WHERE value = ?
+      )
+"""
+
+_UPDATE_LEVEL_SQL = """
+    UPDATE users
+    SET current_subject = ?,
+        current_level = ?
+    WHERE session_id = ?
+"""
+
+# Uses idx_sessions_sid_started — no sort, no table scan
+_LAST_SUMMARY_SQL = """
+    SELECT summary FROM sessions
+    WHERE session_id = ?
+    ORDER BY started_at DESC
+    LIMIT 1
+"""
+
+# Writes a session's staged progress in one go — see flush_session()
+_FLUSH_PROGRESS_SQL = f"""
+    UPDATE users
+    SET session_count   = session_count + ?,
+        total_stars     = total_stars + ?,
+        current_subject = COALESCE(?, current_subject),
+        current_level   = COALESCE(?, current_level),
+        last_seen       = {_NOW_SQL}
+    WHERE session_id = ?
+"""
+
+_INSERT_SESSION_SQL = f"""
+    INSERT INTO sessions (session_id, started_at, ended_at, summary, concepts_taught)
+    VALUES (?, ?, {_NOW_SQL}, ?, ?)
+"""
+
+
+# =============================================================================
+# Shared connection
+# =============================================================================
+
+async def get_db() -> aiosqlite.Connection:
+    """
+    Returns the shared database connection, opening it on first use.
+    Reusing one connection avoids a thread start, file open and journal
+    setup on every query.
+
+    WAL lets readers carry on while a write is in progress, and
+    synchronous=NORMAL drops the extra fsync per commit (still safe in WAL).
+    busy_timeout makes a locked database wait instead of failing at once;
+    wal_autocheckpoint keeps the WAL file from growing unbounded.
+    """
+    global _db
+    if _db is None:
+        _db = await aiosqlite.connect(DB_PATH)
+        _db.row_factory = aiosqlite.Row
+        await _db.execute("PRAGMA journal_mode=WAL")
+        await _db.execute("PRAGMA synchronous=NORMAL")
+        await _db.execute("PRAGMA temp_store=MEMORY")
+        await _db.execute("PRAGMA cache_size=-20000")
+        await _db.execute("PRAGMA busy_timeout=5000")
+        await _db.execute("PRAGMA wal_autocheckpoint=1000")
+    return _db
+
+
+async def close_db():
+    """Closes the shared connection. Called once at shutdown."""
+    global _db
+    if _db is not None:
+        await _db.close()
+        _db = None
+
+
+@asynccontextmanager
+async def write_batch():
+    """
+    Runs a group of writes as one transaction — one commit, one disk sync:
+
+        async with write_batch() as db:
+            await update_session_count(session_id, db=db)
+            await add_stars(session_id, 2, db=db)
+
+    The write helpers below take an optional `db`; given one, they only
+    execute their statement and leave the commit to the batch. Called
+    without it, each helper runs in a batch of its own.
+    Every write goes through here, so coroutines sharing the connection
+    never interleave statements inside each other's transactions.
+    """
+    db = await get_db()
+    async with _write_lock:
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            await db.rollback()
+            raise
+        await db.commit()
+
 
 # =============================================================================
 # Database initialisation — run once at startup
@@ -26,165 +189,285 @@ async def init_db():
     Creates the database and all tables if they don't exist.
     Safe to call every time the app starts.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id              INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id      TEXT UNIQUE NOT NULL,
-                name            TEXT,
-                preferred_language  TEXT DEFAULT 'unknown',
-                literacy_level  INTEGER DEFAULT 0,
-                numeracy_level  INTEGER DEFAULT 0,
-                school_attended TEXT DEFAULT 'unknown',
-                learning_goal   TEXT,
-                learning_path   TEXT DEFAULT '["literacy"]',
-                current_subject TEXT DEFAULT 'literacy',
-                current_level   INTEGER DEFAULT 0,
-                topics_completed TEXT DEFAULT '[]',
-                quiz_scores     TEXT DEFAULT '[]',
-                total_stars     INTEGER DEFAULT 0,
-                session_count   INTEGER DEFAULT 0,
-                last_seen       TEXT,
-                created_at      TEXT,
-                onboarding_done INTEGER DEFAULT 0
-            )
-        """)
-
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS sessions (
-                id              INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id      TEXT NOT NULL,
-                started_at      TEXT,
-                ended_at        TEXT,
-                summary         TEXT,
-                concepts_taught TEXT DEFAULT '[]'
-            )
-        """)
+    db = await get_db()
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id              INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id      TEXT UNIQUE NOT NULL,
+            name            TEXT,
+            preferred_language  TEXT DEFAULT 'unknown',
+            literacy_level  INTEGER DEFAULT 0,
+            numeracy_level  INTEGER DEFAULT 0,
+            school_attended TEXT DEFAULT 'unknown',
+            learning_goal   TEXT,
+            learning_path   TEXT DEFAULT '["literacy"]',
+            current_subject TEXT DEFAULT 'literacy',
+            current_level   INTEGER DEFAULT 0,
+            topics_completed TEXT DEFAULT '[]',
+            quiz_scores     TEXT DEFAULT '[]',
+            total_stars     INTEGER DEFAULT 0,
+            session_count   INTEGER DEFAULT 0,
+            last_seen       TEXT,
+            created_at      TEXT,
+            onboarding_done INTEGER DEFAULT 0
+        )
+    """)
 
-        await db.commit()
-        logger.info("Database initialised at vidya.db")
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            id              INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id      TEXT NOT NULL,
+            started_at      TEXT,
+            ended_at        TEXT,
+            summary         TEXT,
+            concepts_taught TEXT DEFAULT '[]'
+        )
+    """)
+
+    # load_last_summary() runs before Vidya greets a returning student —
+    # keep its "latest session for this student" lookup off a table scan.
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sessions_sid_started
+        ON sessions (session_id, started_at DESC)
+    """)
+
+    await db.commit()
+    logger.info("Database initialised at vidya.db")
 
 
 # =============================================================================
 # User profile functions
 # =============================================================================
 
+def _copy_user(user: dict) -> dict:
+    """Copy with fresh lists — callers append to topics_completed etc."""
+    return {
+        **user,
+        "learning_path":    list(user["learning_path"]),
+        "topics_completed": list(user["topics_completed"]),
+        "quiz_scores":      list(user["quiz_scores"]),
+    }
+
+
+def _remember_user(session_id: str, user: dict):
+    if len(_user_cache) >= USER_CACHE_MAX:
+        del _user_cache[next(iter(_user_cache))]
+    _user_cache[session_id] = (time.monotonic(), _copy_user(user))
+
+
+def _forget_user(session_id: str):
+    _user_cache.pop(session_id, None)
+
+
 async def get_user(session_id: str) -> dict | None:
     """
     Loads a user profile by session_id.
     Returns None if this is a new user.
+    Served from a short-lived in-process cache when possible.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            "SELECT * FROM users WHERE session_id = ?", (session_id,)
-        ) as cursor:
-            row = await cursor.fetchone()
-            if row is None:
-                return None
+    cached = _user_cache.get(session_id)
+    if cached and time.monotonic() - cached[0] < USER_CACHE_TTL:
+        return _copy_user(cached[1])
 
-            user = dict(row)
-            # Parse JSON fields
-            user["learning_path"]     = json.loads(user["learning_path"] or '["literacy"]')
-            user["topics_completed"]  = json.loads(user["topics_completed"] or '[]')
-            user["quiz_scores"]       = json.loads(user["quiz_scores"] or '[]')
-            return user
+    db = await get_db()
+    async with db.execute(_SELECT_USER_SQL, (session_id,)) as cursor:
+        row = await cursor.fetchone()
+        if row is None:
+            return None
+
+        user = dict(row)
+        # Parse JSON fields
+        user["learning_path"]     = orjson.loads(user["learning_path"] or '["literacy"]')
+        user["topics_completed"]  = orjson.loads(user["topics_completed"] or '[]')
+        user["quiz_scores"]       = orjson.loads(user["quiz_scores"] or '[]')
+
+    _remember_user(session_id, user)
+    return user
 
 
 async def save_user(session_id: str, profile: dict) -> dict:
     """
     Creates a new user profile in the database.
     Called after onboarding is complete.
+    Returns the stored profile, built from what was just written rather
+    than read back with another SELECT.
     """
-    now = datetime.now().isoformat()
-
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            INSERT OR REPLACE INTO users (
-                session_id, name, preferred_language, literacy_level,
-                numeracy_level, school_attended, learning_goal,
-                learning_path, current_subject, current_level,
-                session_count, last_seen, created_at, onboarding_done
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+    user = {
+        "session_id":         session_id,
+        "name":               profile.get("name", "Friend"),
+        "preferred_language": profile.get("preferred_language", "unknown"),
+        "literacy_level":     profile.get("literacy_level", 0),
+        "numeracy_level":     profile.get("numeracy_level", 0),
+        "school_attended":    profile.get("school_attended", "unknown"),
+        "learning_goal":      profile.get("learning_goal", "literacy"),
+        "learning_path":      list(profile.get("learning_path", ["literacy"])),
+        "current_subject":    profile.get("current_subject", "literacy"),
+        "current_level":      profile.get("current_level", 0),
+        "topics_completed":   [],
+        "quiz_scores":        [],
+        "total_stars":        0,
+        "session_count":      1,
+        "onboarding_done":    1,
+    }
+
+    async with write_batch() as db:
+        cursor = await db.execute(_INSERT_USER_SQL, (
             session_id,
-            profile.get("name", "Friend"),
-            profile.get("preferred_language", "unknown"),
-            profile.get("literacy_level", 0),
-            profile.get("numeracy_level", 0),
-            profile.get("school_attended", "unknown"),
-            profile.get("learning_goal", "literacy"),
-            json.dumps(profile.get("learning_path", ["literacy"])),
-            profile.get("current_subject", "literacy"),
-            profile.get("current_level", 0),
-            1,
-            now,
-            now,
-            1,
+            user["name"],
+            user["preferred_language"],
+            user["literacy_level"],
+            user["numeracy_level"],
+            user["school_attended"],
+            user["learning_goal"],
+            orjson.dumps(user["learning_path"]).decode(),
+            user["current_subject"],
+            user["current_level"],
+            user["session_count"],
+            user["onboarding_done"],
         ))
-        await db.commit()
+        user_id, created_at = await cursor.fetchone()
+    user = {"id": user_id, **user, "last_seen": created_at, "created_at": created_at}
+    _remember_user(session_id, user)
 
-    logger.info(f"User saved: {profile.get('name')} | lang: {profile.get('preferred_language')} | level: {profile.get('literacy_level')}")
-    return await get_user(session_id)
+    logger.info(
+        "User saved: {} | lang: {} | level: {}",
+        user["name"], user["preferred_language"], user["literacy_level"],
+    )
+    return user
 
 
-async def update_session_count(session_id: str):
+async def update_session_count(session_id: str, db=None):
     """
     Increments the session counter and updates last_seen.
     Called at the start of every session.
     """
-    now = datetime.now().isoformat()
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            UPDATE users
-            SET session_count = session_count + 1,
-                last_seen = ?
-            WHERE session_id = ?
-        """, (now, session_id))
-        await db.commit()
+    if db is None:
+        async with write_batch() as db:
+            return await update_session_count(session_id, db)
+    await db.execute(_TOUCH_SESSION_SQL, (session_id,))
+    _forget_user(session_id)
 
 
-async def add_stars(session_id: str, count: int = 1):
+async def add_stars(session_id: str, count: int = 1, db=None):
     """
     Adds stars to the user's total. Called when a student gets something right.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            UPDATE users
-            SET total_stars = total_stars + ?
-            WHERE session_id = ?
-        """, (count, session_id))
-        await db.commit()
+    if db is None:
+        async with write_batch() as db:
+            return await add_stars(session_id, count, db)
+    await db.execute(_ADD_STARS_SQL, (count, session_id))
+    _forget_user(session_id)
 
 
-async def mark_topic_complete(session_id: str, topic: str):
+async def mark_topic_complete(session_id: str, topic: str, db=None):
     """
     Marks a topic as complete in the user's progress.
+    The append happens inside SQLite (json_insert), skipping topics
+    already in the list — no read-modify-write round-trip.
     """
-    user = await get_user(session_id)
-    if not user:
-        return
+    if db is None:
+        async with write_batch() as db:
+            return await mark_topic_complete(session_id, topic, db)
+    await db.execute(_APPEND_TOPIC_SQL, (topic, session_id, topic))
+    _forget_user(session_id)
 
-    topics = user["topics_completed"]
-    if topic not in topics:
-        topics.append(topic)
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            UPDATE users SET topics_completed = ? WHERE session_id = ?
-        """, (json.dumps(topics), session_id))
-        await db.commit()
+async def mark_topics_complete(session_id: str, topics: list[str], db=None):
+    """
+    Marks several topics complete in one executemany — used at session end.
+    Each row still goes through the de-duplicating append.
+    """
+    if db is None:
+        async with write_batch() as db:
+            return await mark_topics_complete(session_id, topics, db)
+    await db.executemany(
+        _APPEND_TOPIC_SQL, [(topic, session_id, topic) for topic in topics]
+    )
+    _forget_user(session_id)
 
 
-async def update_level(session_id: str, subject: str, level: int):
+async def update_level(session_id: str, subject: str, level: int, db=None):
     """
     Updates the user's current subject and level.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            UPDATE users
-            SET current_subject = ?,
-                current_level = ?
-            WHERE session_id = ?
-        """, (subject, level, session_id))
-        await db.commit()
+    if db is None:
+        async with write_batch() as db:
+            return await update_level(session_id, subject, level, db)
+    await db.execute(_UPDATE_LEVEL_SQL, (subject, level, session_id))
+    _forget_user(session_id)
+
+
+# =============================================================================
+# Per-session progress
+# Counters and the current subject/level change during a lesson but only
+# need to be durable once it ends. They are staged here in memory and
+# written with a single UPDATE by flush_session() on disconnect.
+# =============================================================================
+
+_staged_progress: dict[str, dict] = {}
+
+
+def stage_progress(session_id: str, *, sessions: int = 0, stars: int = 0,
+                   subject: str | None = None, level: int | None = None):
+    """
+    Records progress for this session without touching the database.
+    Counts accumulate; subject and level keep the latest value.
+    """
+    progress = _staged_progress.setdefault(session_id, {
+        "sessions": 0, "stars": 0, "subject": None, "level": None,
+    })
+    progress["sessions"] += sessions
+    progress["stars"]    += stars
+    if subject is not None:
+        progress["subject"] = subject
+    if level is not None:
+        progress["level"] = level
+
+
+async def flush_session(session_id: str, db=None):
+    """Writes any staged progress for this session. No-op if there is none."""
+    if db is None:
+        if session_id not in _staged_progress:
+            return
+        async with write_batch() as db:
+            return await flush_session(session_id, db)
+    progress = _staged_progress.pop(session_id, None)
+    if progress is None:
+        return
+    await db.execute(_FLUSH_PROGRESS_SQL, (
+        progress["sessions"],
+        progress["stars"],
+        progress["subject"],
+        progress["level"],
+        session_id,
+    ))
+    _forget_user(session_id)
+
+
+# =============================================================================
+# Session history
+# =============================================================================
+
+async def save_session(session_id: str, started_at: str, summary: str,
+                       concepts: list[str]):
+    """
+    Writes the end-of-session record in one transaction: the sessions row,
+    the concepts appended to the user's topics_completed, and any staged
+    progress for the session.
+    One commit means one disk sync on disconnect instead of one per statement.
+    """
+    async with write_batch() as db:
+        await db.execute(_INSERT_SESSION_SQL, (
+            session_id, started_at, summary, orjson.dumps(concepts).decode(),
+        ))
+        if concepts:
+            await mark_topics_complete(session_id, concepts, db=db)
+        await flush_session(session_id, db=db)
+
+
+async def get_last_summary(session_id: str) -> str | None:
+    """Returns the summary of the student's most recent session, if any."""
+    db = await get_db()
+    async with db.execute(_LAST_SUMMARY_SQL, (session_id,)) as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row else None
@@ -9,41 +9,38 @@
 # Also assigns a literacy level and custom learning path.
 # =============================================================================
 
+import re
 from loguru import logger
 
 
+# =============================================================================
+# Opening line — spoken directly by TTS when a new student connects.
+# Must match QUESTION 1 below so the LLM picks up at question 2.
+# =============================================================================
+
+ONBOARDING_GREETING = "Hello! I am Vidya, your teacher. I am so happy to meet you! What is your name?"
+
+
 # =============================================================================
 # Onboarding system prompt
 # This replaces the normal Vidya prompt during the onboarding phase.
 # =============================================================================
 
 ONBOARDING_PROMPT = """
-You are Vidya, a teacher. You are meeting a new student for the first time.
-
-You must ask EXACTLY these 7 questions, ONE AT A TIME, in ORDER.
-Do NOT skip any question. Do NOT start teaching until all 7 are answered.
-
-QUESTION 1: "Hello! I am Vidya, your teacher. I am so happy to meet you! What is your name?"
-QUESTION 2: "Nice to meet you [name]! Which language do you speak at home?"
-QUESTION 3: "Can you count to ten for me? Please try."
-QUESTION 4: "Do you know any letters? Tell me one letter if you know."
-QUESTION 5: "Have you ever been to school before?"
-QUESTION 6: "What would you most like to learn — reading and writing, numbers, or something else?"
-QUESTION 7: "Why do you want to learn — is it for work, for your family, or for yourself?"
-
-STRICT RULES:
-- Ask ONE question at a time. Wait for the answer.
-- After each answer say something warm, then ask the NEXT question.
-- Never teach anything until all 7 questions are done.
-- After question 7 say: "Thank you [name]! Now let us begin learning together."
-- Respond in whatever language the student speaks.
-
-TRACKING (internal — do not say these out loud):
-- After question 3: if they can count to 10 correctly → numeracy_level = 1, else → 0
-- After question 4: if they know letters → literacy_level = 1, else → 0
-- After question 5: note school_attended = yes/no
-- After question 6: note learning_goal
-- After question 7: note motivation
+You are Vidya, a teacher, meeting a new student for the first time.
+Ask EXACTLY these 7 questions, ONE AT A TIME, in ORDER. Never skip one.
+Do NOT teach anything until all 7 are answered.
+
+1. "Hello! I am Vidya, your teacher. I am so happy to meet you! What is your name?"
+2. "Nice to meet you [name]! Which language do you speak at home?"
+3. "Can you count to ten for me? Please try."
+4. "Do you know any letters? Tell me one letter if you know."
+5. "Have you ever been to school before?"
+6. "What would you most like to learn — reading and writing, numbers, or something else?"
+7. "Why do you want to learn — is it for work, for your family, or for yourself?"
+
+After each answer say something warm, then ask the next question.
+After question 7 say: "Thank you [name]! Now let us begin learning together."
 """
 
 
@@ -52,6 +49,38 @@ TRACKING (internal — do not say these out loud):
 # Based on the user's answers, assign a custom learning path.
 # =============================================================================
 
+# (goal keywords, motivation keywords, path) — checked in order, first hit
+# wins. Keywords match as substrings, so "farm" also catches "farmer".
+LEARNING_PATH_RULES = (
+    # Farmer path
+    (("farm",),                    ("farm", "work"),
+     ("literacy", "numeracy", "life_skills", "science", "vocational")),
+    # Parent path
+    ((),                           ("child", "family", "parent"),
+     ("literacy", "numeracy", "health", "life_skills", "science")),
+    # Job seeker path
+    (("job", "work"),              ("business",),
+     ("literacy", "numeracy", "life_skills", "civics", "vocational")),
+    # Numeracy focused
+    (("math", "number", "count"),  (),
+     ("numeracy", "literacy", "life_skills", "science")),
+    (("science",),                 (),
+     ("literacy", "numeracy", "science", "geography", "life_skills")),
+)
+
+# Default balanced path — literacy first for everyone
+BASE_LEARNING_PATH = ("literacy", "numeracy", "life_skills")
+
+# Every rule keyword in one alternation, so goal and motivation are each
+# scanned once. No \b anchors — keywords match inside longer words,
+# exactly like the substring checks the rules describe.
+_PATH_KEYWORDS = re.compile("|".join(sorted(
+    {re.escape(w) for goal_words, motivation_words, _ in LEARNING_PATH_RULES
+     for w in goal_words + motivation_words},
+    key=lambda w: (-len(w), w),
+)))
+
+
 def assign_learning_path(profile: dict) -> list:
     """
     Returns an ordered list of subjects based on the user's goal and level.
@@ -60,31 +89,19 @@ def assign_learning_path(profile: dict) -> list:
     goal = profile.get("learning_goal", "").lower()
     motivation = profile.get("motivation", "").lower()
 
-    # Default path — literacy first for everyone
-    base_path = ["literacy", "numeracy", "life_skills"]
-
-    if "farm" in goal or "farm" in motivation or "work" in motivation:
-        # Farmer path
-        return ["literacy", "numeracy", "life_skills", "science", "vocational"]
-
-    elif "child" in motivation or "family" in motivation or "parent" in motivation:
-        # Parent path
-        return ["literacy", "numeracy", "health", "life_skills", "science"]
+    goal_hits = set(_PATH_KEYWORDS.findall(goal))
+    motivation_hits = set(_PATH_KEYWORDS.findall(motivation))
 
-    elif "job" in goal or "work" in goal or "business" in motivation:
-        # Job seeker path
-        return ["literacy", "numeracy", "life_skills", "civics", "vocational"]
+    for goal_words, motivation_words, path in LEARNING_PATH_RULES:
+        if goal_hits.intersection(goal_words) or motivation_hits.intersection(motivation_words):
+            return list(path)
+    return list(BASE_LEARNING_PATH)
 
-    elif "math" in goal or "number" in goal or "count" in goal:
-        # Numeracy focused
-        return ["numeracy", "literacy", "life_skills", "science"]
 
-    elif "science" in goal:
-        return ["literacy", "numeracy", "science", "geography", "life_skills"]
-
-    else:
-        # Default balanced path
-        return base_path
+# Answers meaning "never went to school" — the wider set includes Hindi,
+# Tamil and Telugu replies
+NO_SCHOOL_ANSWERS = frozenset({"no", "never"})
+NO_SCHOOL_ANSWERS_ANY_LANG = NO_SCHOOL_ANSWERS | {"nahi", "illa", "ledu"}
 
 
 def assign_literacy_level(profile: dict) -> int:
@@ -94,11 +111,11 @@ def assign_literacy_level(profile: dict) -> int:
     knows_letters = profile.get("knows_letters", False)
     school = profile.get("school_attended", "no").lower()
 
-    if not knows_letters and school in ["no", "never", "nahi", "illa", "ledu"]:
+    if not knows_letters and school in NO_SCHOOL_ANSWERS_ANY_LANG:
         return 0    # Complete beginner
-    elif knows_letters and school in ["no", "never"]:
+    elif knows_letters and school in NO_SCHOOL_ANSWERS:
         return 1    # Self-taught some letters
-    elif school not in ["no", "never"]:
+    elif school not in NO_SCHOOL_ANSWERS:
         return 2    # Has some schooling
     else:
         return 0
@@ -137,9 +154,8 @@ def build_profile_from_onboarding(session_id: str, answers: dict) -> dict:
     profile["current_subject"] = profile["learning_path"][0]
     profile["current_level"]   = profile["literacy_level"]
 
-    logger.info(f"Profile built for {profile['name']}: "
-                f"lang={profile['preferred_language']} "
-                f"lit_level={profile['literacy_level']} "
-                f"path={profile['learning_path']}")
+    logger.info("Profile built for {}: lang={} lit_level={} path={}",
+                profile["name"], profile["preferred_language"],
+                profile["literacy_level"], profile["learning_path"])
 
     return profile
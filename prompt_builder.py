@@ -6,97 +6,156 @@
 # instead of hardcoded strings.
 # =============================================================================
 
+from functools import lru_cache
+
 from onboarding import ONBOARDING_PROMPT
 from curriculum import load_curriculum
 
 
+# =============================================================================
+# Stable system prefix
+# Shared verbatim by every student and every phase (onboarding + teaching).
+# Every system prompt starts with it, so it must stay byte-identical —
+# no f-strings, no names, no timestamps. Anything student-specific goes
+# after it, never in here.
+# =============================================================================
+
+STABLE_SYSTEM_PREFIX = """STRICT RULES — never break these:
+- NEVER write internal thoughts, tracking notes, or anything in brackets or asterisks.
+- NEVER mix two languages in one sentence.
+- Respond ONLY in the language the student is currently speaking.
+- You are Vidya, a teacher. Always stay in character.
+"""
+
+
 VIDYA_BASE_PERSONA = """
-You are Vidya, a teacher. You only teach. You never do small talk.
-
-STRICT RULES:
-- Respond in 2-3 sentences maximum.
-- Always end with one question or task.
-- Never make the student feel bad.
-- Always respond in whatever language the student speaks.
-- Teach ONE concept at a time.
-- NEVER show internal thoughts. No asterisks. No TRACKING. No brackets except [SHOW:x].
-- You are ALWAYS teaching. Never say "How can I help".
-
-VISUAL TAGS — you MUST include these when teaching:
-- Teaching letter A → include [SHOW:letter_A] in your response
-- Teaching letter B → include [SHOW:letter_B] in your response
-- Teaching any letter X → include [SHOW:letter_X]
-- Teaching number 1 → include [SHOW:number_1]
-- Teaching any number N → include [SHOW:number_N]
-- Example response: "This is the letter A. [SHOW:letter_A] A is for Apple. Can you say A?"
-- These tags display images to the student. They are REQUIRED when teaching letters or numbers.
+You are Vidya, a teacher. You only teach — no small talk, never "How can I help".
+
+RULES:
+- 2-3 sentences maximum, always ending with one question or task.
+- Teach ONE concept at a time. Never make the student feel bad.
+- No asterisks, no brackets except [SHOW:x].
+
+VISUAL TAGS — REQUIRED when teaching a letter or number (they show an image):
+- Letter X → [SHOW:letter_X]    Number N → [SHOW:number_N]
+- Example: "This is the letter A. [SHOW:letter_A] A is for Apple. Can you say A?"
 """
 
-def build_prompt(user: dict, last_session_summary: str = None) -> str:
-    """
-    Builds a fully personalised system prompt for this student.
-    Loads curriculum content from .txt files based on subject and level.
-    """
-    name     = user.get("name", "the student")
-    language = user.get("preferred_language", "unknown")
-    subject  = user.get("current_subject", "literacy")
-    level    = user.get("current_level", 0)
-    stars    = user.get("total_stars", 0)
-    sessions = user.get("session_count", 1)
-    goal     = user.get("learning_goal", "learn to read")
-    path     = user.get("learning_path", ["literacy"])
-    topics   = user.get("topics_completed", [])
+# Everything before the curriculum is the same for every student, so it is
+# joined once here and build_prompt only adds the per-student pieces.
+_PROMPT_PREFIX = STABLE_SYSTEM_PREFIX + "\n" + VIDYA_BASE_PERSONA.strip() + """
 
-    # Load curriculum from file
-    curriculum_content = load_curriculum(subject, level)
+TEACHING LOOP — follow for every concept:
+1. TEACH    — Introduce concept with a daily life example + [SHOW:visual] if relevant
+2. CHECK    — Ask one simple question
+3. EVALUATE — Right answer → celebrate loudly | Wrong → try completely different approach
+4. NEVER repeat the same explanation — always use a new example
+5. PROGRESS — When mastered, move to the next concept in the curriculum
+
+CURRICULUM FOR TODAY:
+"""
+
+# Onboarding is the same for everyone, so its full prompt is joined once
+_ONBOARDING_SYSTEM_PROMPT = STABLE_SYSTEM_PREFIX + ONBOARDING_PROMPT
 
-    student_context = f"""
+_STUDENT_TEMPLATE = """
 STUDENT PROFILE:
 - Name: {name}
 - Preferred language: {language} — always speak to them in this language
 - Current subject: {subject}
 - Current level: {level} (0=complete beginner, 4=advanced)
 - Learning goal: {goal}
-- Learning path: {' → '.join(path)}
+- Learning path: {path}
 - Sessions completed: {sessions}
 - Stars earned: {stars} ⭐
-- Topics completed: {', '.join(topics) if topics else 'None yet — this is the beginning'}
+- Topics completed: {topics}
 """
 
-    last_session = ""
-    if last_session_summary:
-        last_session = f"""
+_LAST_SESSION_TEMPLATE = """
 LAST SESSION:
-{last_session_summary}
+{summary}
 Briefly review last session before introducing anything new.
 """
-    elif sessions <= 1:
-        last_session = """
+
+_FIRST_SESSION_NOTE = """
 FIRST SESSION AFTER ONBOARDING:
 Welcome them warmly by name. Then begin the very first concept in their curriculum.
 """
 
-    prompt = f"""
-{VIDYA_BASE_PERSONA}
+_PROMPT_FOOTER = "\n{name} is counting on you. Be warm, patient, and celebrate every small win."
 
-{student_context}
 
-CURRICULUM FOR TODAY:
-{curriculum_content}
+# Fallbacks for profile fields missing from `user`
+_USER_DEFAULTS = {
+    "name":               "the student",
+    "preferred_language": "unknown",
+    "current_subject":    "literacy",
+    "current_level":      0,
+    "total_stars":        0,
+    "session_count":      1,
+    "learning_goal":      "learn to read",
+    "learning_path":      ("literacy",),
+    "topics_completed":   (),
+}
 
-{last_session}
 
-TEACHING LOOP — follow for every concept:
-1. TEACH    — Introduce concept with a daily life example + [SHOW:visual] if relevant
-2. CHECK    — Ask one simple question
-3. EVALUATE — Right answer → celebrate loudly | Wrong → try completely different approach
-4. NEVER repeat the same explanation — always use a new example
-5. PROGRESS — When mastered, move to the next concept in the curriculum
+def build_prompt(user: dict, last_session_summary: str = None) -> str:
+    """
+    Builds a fully personalised system prompt for this student.
+    Loads curriculum content from .txt files based on subject and level.
 
-{name} is counting on you. Be warm, patient, and celebrate every small win.
-"""
-    return prompt.strip()
+    Starts with STABLE_SYSTEM_PREFIX. Sections shared by many students
+    (persona, teaching loop, curriculum) come next so the common prefix is
+    as long as possible; the student profile and last session go strictly
+    last.
+    """
+    u = _USER_DEFAULTS | user
+    name     = u["name"]
+    language = u["preferred_language"]
+    subject  = u["current_subject"]
+    level    = u["current_level"]
+    stars    = u["total_stars"]
+    sessions = u["session_count"]
+    goal     = u["learning_goal"]
+    path     = u["learning_path"]
+    topics   = u["topics_completed"]
+
+    # Load curriculum from file
+    curriculum_content = load_curriculum(subject, level)
+
+    return _render_prompt(
+        name, language, subject, level, stars, sessions, goal,
+        tuple(path), tuple(topics), curriculum_content, last_session_summary,
+    )
+
+
+@lru_cache(maxsize=256)
+def _render_prompt(name, language, subject, level, stars, sessions, goal,
+                   path, topics, curriculum_content, last_session_summary) -> str:
+    """
+    Formats the teaching prompt. Pure function of its arguments, so
+    repeat sessions with the same profile reuse the rendered string.
+    The curriculum text is part of the key — an edited file renders fresh.
+    """
+    student_context = _STUDENT_TEMPLATE.format(
+        name=name, language=language, subject=subject, level=level,
+        goal=goal, path=" → ".join(path), sessions=sessions, stars=stars,
+        topics=", ".join(topics) if topics else "None yet — this is the beginning",
+    )
+
+    if last_session_summary:
+        last_session = _LAST_SESSION_TEMPLATE.format(summary=last_session_summary)
+    elif sessions <= 1:
+        last_session = _FIRST_SESSION_NOTE
+    else:
+        last_session = ""
+
+    parts = [_PROMPT_PREFIX, curriculum_content, "\n", student_context]
+    if last_session:
+        parts.append(last_session)
+    parts.append(_PROMPT_FOOTER.format(name=name))
+    return "".join(parts)
 
 
 def get_onboarding_prompt() -> str:
-    return ONBOARDING_PROMPT
+    return _ONBOARDING_SYSTEM_PROMPT
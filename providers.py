@@ -8,23 +8,31 @@
 # To swap any service in the future — change ONLY the relevant function here.
 # =============================================================================
 
-import os
-from dotenv import load_dotenv
-
-from pipecat.services.openai.llm import OpenAILLMService
+from pipecat.services.google.llm import GoogleLLMService
 from pipecat.services.sarvam.stt import SarvamSTTService
 from pipecat.services.sarvam.tts import SarvamTTSService
 from pipecat.transports.base_transport import TransportParams
 
-load_dotenv(override=True)
+from config import GOOGLE_API_KEY, SARVAM_API_KEY
+
+
+def get_llm():
+    """
+    Returns the LLM service — the teaching brain.
+    To swap to GPT-4o, Claude, Groq — change ONLY this function.
 
+    No system_instruction here: the system prompt is the first message of
+    the context (see prompt_builder), so there is exactly one system text
+    and it always starts with the stable prefix. Gemini would otherwise
+    keep only one of the two.
 
-def get_llm(system_prompt: str = None):
-    from pipecat.services.google.llm import GoogleLLMService
+    Not cached: a Pipecat service is a processor linked into one pipeline,
+    so every session needs its own instance. The same goes for get_stt,
+    get_tts and get_transport_params (transports write to their params).
+    """
     return GoogleLLMService(
-        api_key=os.getenv("GOOGLE_API_KEY"),
+        api_key=GOOGLE_API_KEY,
         model="gemini-2.5-flash",
-        system_instruction=system_prompt or "You are Vidya, a teacher. Only teach. Never say 'How may I help you'.",
     )
 
 
@@ -35,11 +43,21 @@ def get_stt():
 
     language="unknown" = auto-detects Hindi, Telugu, Tamil, Kannada, etc.
     Never force users to select a language.
+
+    Sarvam streams audio over a websocket and transcribes while the student
+    is still speaking. vad_signals=True lets Sarvam's server-side VAD end the
+    turn, so the final transcript arrives right after speech stops instead
+    of after a separate local silence timeout. high_vad_sensitivity keeps
+    that endpointing short.
     """
     return SarvamSTTService(
-        api_key=os.getenv("SARVAM_API_KEY"),
+        api_key=SARVAM_API_KEY,
         language="unknown",
         model="saarika:v2.5",
+        settings=SarvamSTTService.Settings(
+            vad_signals=True,
+            high_vad_sensitivity=True,
+        ),
     )
 
 
@@ -51,7 +69,7 @@ def get_tts():
     pace=0.8 = slightly slower speech — important for uneducated learners.
     """
     return SarvamTTSService(
-        api_key=os.getenv("SARVAM_API_KEY"),
+        api_key=SARVAM_API_KEY,
         target_language_code="en-IN",
         model="bulbul:v3",
         speaker="priya",
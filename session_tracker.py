@@ -12,16 +12,16 @@
 #   from session_tracker import SessionTracker
 #   tracker = SessionTracker(session_id)
 #   tracker.record_visual(asset_key)       # called when [SHOW:x] fires
+#   tracker.record_reply_text(text)        # called as Vidya's reply streams
 #   tracker.record_exchange(user, vidya)   # called after each turn
 #   summary = await tracker.save()         # called on disconnect
 # =============================================================================
 
-import json
 import re
+from itertools import islice
 from datetime import datetime
 from loguru import logger
-from db import DB_PATH
-import aiosqlite
+from db import get_last_summary, save_session
 
 
 # Keywords that indicate a concept was taught
@@ -37,45 +37,87 @@ CONCEPT_PATTERNS = {
 }
 
 
+# Asset key prefix → concept label, e.g. "letter_A" → "Letter A"
+_CONCEPT_LABELS = {"letter": "Letter", "number": "Number", "vowel": "Vowel"}
+
+# Phrases in Vidya's reply that mean the student got it right
+SUCCESS_WORDS = ("बहुत अच्छे", "शाबाश", "great", "correct", "well done",
+                 "excellent", "perfect", "बिल्कुल सही", "ਬਹੁਤ ਵਧੀਆ")
+_SUCCESS_RE = re.compile("|".join(map(re.escape, SUCCESS_WORDS)), re.IGNORECASE)
+
+# All concept patterns in one alternation — one named group per concept —
+# so Vidya's text is scanned once per turn instead of once per pattern
+_CONCEPT_RE = re.compile(
+    "|".join(
+        f"(?P<c{i}>{'|'.join(map(re.escape, patterns))})"
+        for i, patterns in enumerate(CONCEPT_PATTERNS.values())
+    ),
+    re.IGNORECASE,
+)
+_GROUP_TO_CONCEPT = {f"c{i}": concept for i, concept in enumerate(CONCEPT_PATTERNS)}
+
+# Characters of the previous reply chunk that are scanned again with the
+# next one — one less than the longest pattern, so a keyword split across
+# two chunks is still found whole
+_CONCEPT_OVERLAP = max(
+    len(pattern) for patterns in CONCEPT_PATTERNS.values() for pattern in patterns
+) - 1
+
+
 class SessionTracker:
     """
     Tracks a single session's teaching activity.
     Created at session start, saved at session end.
     """
+    __slots__ = ("session_id", "started_at", "visuals_shown", "concepts_taught",
+                 "exchange_count", "student_successes", "student_struggles",
+                 "_reply_tail")
 
     def __init__(self, session_id: str):
         self.session_id = session_id
-        self.started_at = datetime.now().isoformat()
-        self.visuals_shown: list[str] = []       # All [SHOW:x] keys fired
-        self.concepts_taught: list[str] = []     # Concepts detected as taught
-        self.exchanges: list[dict] = []          # Full conversation turns
+        # Milliseconds, matching the ended_at that SQLite stamps (db._NOW_SQL)
+        self.started_at = datetime.now().isoformat(timespec="milliseconds")
+        # Insertion-ordered sets (dict keys) — O(1) "seen already?" checks
+        self.visuals_shown: dict[str, None] = {}     # All [SHOW:x] keys fired
+        self.concepts_taught: dict[str, None] = {}   # Concepts detected as taught
+        self.exchange_count: int = 0             # Conversation turns so far
         self.student_successes: int = 0          # Times student got it right
         self.student_struggles: list[str] = []   # Concepts student found hard
+        self._reply_tail = ""                    # End of the last reply chunk
 
     def record_visual(self, asset_key: str):
         """Called every time a [SHOW:x] tag fires."""
-        if asset_key not in self.visuals_shown:
-            self.visuals_shown.append(asset_key)
+        self.visuals_shown.setdefault(asset_key, None)
         # Map asset key to concept
         concept = self._asset_to_concept(asset_key)
         if concept and concept not in self.concepts_taught:
-            self.concepts_taught.append(concept)
-            logger.debug(f"Concept tracked: {concept}")
+            self.concepts_taught[concept] = None
+            logger.debug("Concept tracked: {}", concept)
+
+    def record_reply_text(self, text: str):
+        """
+        Called with each piece of Vidya's reply as it streams out, so
+        concepts are picked up while the text is already being scanned for
+        [SHOW:x] tags instead of in a second pass over the whole turn.
+        Matching the overlap twice is harmless — concepts_taught is a set.
+        """
+        text = self._reply_tail + text
+        self._detect_concepts_from_text(text)
+        self._reply_tail = text[-_CONCEPT_OVERLAP:]
+
+    def end_reply(self):
+        """Called when a reply ends or is cut off."""
+        self._reply_tail = ""
 
     def record_exchange(self, user_text: str, vidya_text: str):
-        """Called after each conversation turn."""
-        self.exchanges.append({
-            "user": user_text,
-            "vidya": vidya_text,
-            "time": datetime.now().isoformat(),
-        })
+        """
+        Called after each conversation turn. Concepts in vidya_text were
+        already found by record_reply_text.
+        """
+        self.exchange_count += 1
         # Detect success signals in Vidya's response
-        success_words = ["बहुत अच्छे", "शाबाश", "great", "correct", "well done",
-                         "excellent", "perfect", "बिल्कुल सही", "ਬਹੁਤ ਵਧੀਆ"]
-        if any(w.lower() in vidya_text.lower() for w in success_words):
+        if _SUCCESS_RE.search(vidya_text):
             self.student_successes += 1
-        # Detect concepts from Vidya's text
-        self._detect_concepts_from_text(vidya_text)
 
     def build_summary(self) -> str:
         """
@@ -86,8 +128,8 @@ class SessionTracker:
             return "No specific concepts were covered — student was still in onboarding or warming up."
 
         concepts_str = ', '.join(self.concepts_taught) if self.concepts_taught else 'general introduction'
-        visuals_str  = ', '.join(self.visuals_shown[:5]) if self.visuals_shown else 'none'
-        exchanges    = len(self.exchanges)
+        visuals_str  = ', '.join(islice(self.visuals_shown, 5)) if self.visuals_shown else 'none'
+        exchanges    = self.exchange_count
 
         summary = (
             f"Last session covered: {concepts_str}. "
@@ -110,37 +152,11 @@ class SessionTracker:
         Returns the summary string so agent.py can use it immediately.
         """
         summary = self.build_summary()
-        ended_at = datetime.now().isoformat()
-
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute("""
-                INSERT INTO sessions (session_id, started_at, ended_at, summary, concepts_taught)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
-                self.session_id,
-                self.started_at,
-                ended_at,
-                summary,
-                json.dumps(self.concepts_taught),
-            ))
-
-            # Also update the user's last session summary and topics
-            if self.concepts_taught:
-                await db.execute("""
-                    UPDATE users
-                    SET topics_completed = json(
-                        CASE
-                            WHEN topics_completed IS NULL OR topics_completed = '[]'
-                            THEN json_array()
-                            ELSE topics_completed
-                        END
-                    )
-                    WHERE session_id = ?
-                """, (self.session_id,))
-
-            await db.commit()
-
-        logger.info(f"Session saved: {self.session_id} | concepts: {self.concepts_taught}")
+
+        # ended_at is stamped by SQLite as the row is written
+        await save_session(self.session_id, self.started_at, summary, list(self.concepts_taught))
+
+        logger.info("Session saved: {} | concepts: {}", self.session_id, list(self.concepts_taught))
         return summary
 
     async def load_last_summary(self) -> str | None:
@@ -148,17 +164,7 @@ class SessionTracker:
         Loads the most recent session summary for this student.
         Used by agent.py to build the teaching prompt.
         """
-        async with aiosqlite.connect(DB_PATH) as db:
-            async with db.execute("""
-                SELECT summary FROM sessions
-                WHERE session_id = ?
-                ORDER BY started_at DESC
-                LIMIT 1
-            """, (self.session_id,)) as cursor:
-                row = await cursor.fetchone()
-                if row:
-                    return row[0]
-                return None
+        return await get_last_summary(self.session_id)
 
     # ------------------------------------------------------------------
     # Internal helpers
@@ -166,19 +172,15 @@ class SessionTracker:
 
     def _asset_to_concept(self, asset_key: str) -> str | None:
         """Maps an asset key like 'letter_A' to a concept name."""
-        if asset_key.startswith("letter_"):
-            return f"Letter {asset_key.split('_')[1]}"
-        if asset_key.startswith("number_"):
-            return f"Number {asset_key.split('_')[1]}"
-        if asset_key.startswith("vowel_"):
-            return f"Vowel {asset_key.split('_')[1]}"
+        prefix, sep, rest = asset_key.partition("_")
+        label = _CONCEPT_LABELS.get(prefix)
+        if label and sep:
+            return f"{label} {rest.split('_', 1)[0]}"
         return asset_key
 
     def _detect_concepts_from_text(self, text: str):
         """Scans Vidya's text for concept keywords."""
-        text_lower = text.lower()
-        for concept, patterns in CONCEPT_PATTERNS.items():
-            if any(p.lower() in text_lower for p in patterns):
-                readable = self._asset_to_concept(concept) or concept
-                if readable not in self.concepts_taught:
-                    self.concepts_taught.append(readable)
+        for match in _CONCEPT_RE.finditer(text):
+            concept = _GROUP_TO_CONCEPT[match.lastgroup]
+            readable = self._asset_to_concept(concept) or concept
+            self.concepts_taught.setdefault(readable, None)
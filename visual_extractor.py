@@ -12,38 +12,146 @@
 # Usage in agent.py:
 #   from visual_extractor import extract_visuals
 #   clean_text, asset_key = extract_visuals(text)
+#
+# For streamed LLM output use a VisualTagScanner, which handles tags that
+# are split across two TextFrames:
+#   scanner = VisualTagScanner()
+#   clean_text, asset_keys = scanner.feed(chunk)
 # =============================================================================
 
 import re
+import asyncio
+import orjson
+from collections.abc import Sequence
+from functools import lru_cache
 from loguru import logger
 
 # Pattern matches [SHOW:anything] anywhere in text
 SHOW_PATTERN = re.compile(r'\[SHOW:([^\]]+)\]')
 
+# Runs of spaces left behind once a tag is removed
+_SPACES = re.compile(r'  +')
+
+SHOW_OPEN = "[SHOW:"
+
+# Longest tag we wait for. Real tags are short (e.g. [SHOW:number_20]); an
+# unclosed "[SHOW:" longer than this is treated as plain text, so a stray
+# bracket can never hold back the rest of a response.
+MAX_TAG_LEN = 64
 
-def extract_visuals(text: str) -> tuple[str, list[str]]:
+# Shared "no tags" result — returned on the fast paths instead of a new []
+NO_KEYS: tuple[str, ...] = ()
+
+
+def extract_visuals(text: str) -> tuple[str, Sequence[str]]:
     """
     Extracts all [SHOW:x] tags from text.
 
     Returns:
         (clean_text, asset_keys)
         clean_text  — text with all [SHOW:x] tags removed (for TTS)
-        asset_keys  — list of asset keys to display (for WebSocket)
+        asset_keys  — asset keys to display (for WebSocket); the shared
+                      empty NO_KEYS tuple when there are none
 
     Example:
         "This is letter A. [SHOW:letter_A] Say Aaa!"
         → ("This is letter A. Say Aaa!", ["letter_A"])
     """
-    asset_keys = SHOW_PATTERN.findall(text)
-    clean_text = SHOW_PATTERN.sub('', text).strip()
+    # Most text has no tag — skip the regex entirely. A single-character
+    # "[" search is the cheapest test and settles nearly every chunk; the
+    # full "[SHOW:" check covers text with ordinary brackets.
+    if "[" not in text or SHOW_OPEN not in text:
+        return text, NO_KEYS
+
+    asset_keys = []
 
-    # Clean up any double spaces left after tag removal
-    clean_text = re.sub(r'  +', ' ', clean_text)
+    def _collect(match: re.Match) -> str:
+        asset_keys.append(match.group(1))
+        return ""
+
+    # The tag pass collects keys as it removes them — no separate findall
+    clean_text = SHOW_PATTERN.sub(_collect, text)
+    if not asset_keys:
+        return text, NO_KEYS
+
+    logger.debug("Visual signals extracted: {}", asset_keys)
+    return _SPACES.sub(" ", clean_text.strip()), asset_keys
+
+
+def scan_visuals(text: str) -> tuple[str, list[str], str]:
+    """
+    Streaming version of extract_visuals for token-sized LLM chunks.
 
-    if asset_keys:
-        logger.debug(f"Visual signals extracted: {asset_keys}")
+    Uses plain str.find instead of regex, and never strips whitespace —
+    streamed chunks carry their own leading spaces.
 
-    return clean_text, asset_keys
+    Returns:
+        (clean_text, asset_keys, carry)
+        carry — a trailing partial tag (e.g. "[SHOW:let") that must be
+                prepended to the next chunk before scanning it; never
+                longer than MAX_TAG_LEN
+
+    Example:
+        scan_visuals("This is A. [SHOW:let") → ("This is A. ", [], "[SHOW:let")
+        scan_visuals("[SHOW:letter_A] Say A") → (" Say A", ["letter_A"], "")
+    """
+    parts = []
+    asset_keys = []
+    pos = 0
+    while True:
+        start = text.find("[", pos)
+        if start == -1:
+            parts.append(text[pos:])
+            return "".join(parts), asset_keys, ""
+
+        if text.startswith(SHOW_OPEN, start):
+            end = text.find("]", start + len(SHOW_OPEN), start + MAX_TAG_LEN)
+            if end == -1:
+                if len(text) - start >= MAX_TAG_LEN:
+                    # Too long to be a tag — keep it as ordinary text
+                    parts.append(text[pos:start + 1])
+                    pos = start + 1
+                    continue
+                # Tag opened but not closed yet — wait for the next chunk
+                parts.append(text[pos:start])
+                return "".join(parts), asset_keys, text[start:]
+            asset_key = text[start + len(SHOW_OPEN):end]
+            if asset_key:
+                asset_keys.append(asset_key)
+            parts.append(text[pos:start])
+            pos = end + 1
+        elif SHOW_OPEN.startswith(text[start:]):
+            # Chunk ends part-way through "[SHOW:" itself
+            parts.append(text[pos:start])
+            return "".join(parts), asset_keys, text[start:]
+        else:
+            # An ordinary bracket — keep it
+            parts.append(text[pos:start + 1])
+            pos = start + 1
+
+
+class VisualTagScanner:
+    """
+    Single-pass [SHOW:x] scanner for one stream of LLM text.
+    Keeps any partial tag between chunks, so the caller just feeds each
+    chunk in and forwards whatever clean text comes back.
+    """
+    def __init__(self):
+        self._carry = ""
+
+    def feed(self, text: str) -> tuple[str, Sequence[str]]:
+        # Fast path for the common token chunk: no tag, nothing pending
+        if not self._carry and "[" not in text:
+            return text, NO_KEYS
+        if self._carry:
+            text = self._carry + text
+        clean_text, asset_keys, self._carry = scan_visuals(text)
+        return clean_text, asset_keys
+
+    def reset(self) -> str:
+        """Forgets any unterminated tag and returns it."""
+        dropped, self._carry = self._carry, ""
+        return dropped
 
 
 # =============================================================================
@@ -52,41 +160,107 @@ def extract_visuals(text: str) -> tuple[str, list[str]]:
 # Used by backend.py to push visual signals to the browser
 # =============================================================================
 
+# Queue marker for send_hide — asset keys are always str, so this can't clash
+HIDE = None
+
+# Hide never changes, so it is encoded once
+_HIDE_FRAME = orjson.dumps({"hide": True}).decode()
+
+
+@lru_cache(maxsize=256)
+def _show_frame(asset_key: str) -> str:
+    """The {"show": key} message for one asset — the same few keys repeat."""
+    return orjson.dumps({"show": asset_key}).decode()
+
+
+def _show_message(asset_keys: list[str]) -> str:
+    if len(asset_keys) == 1:
+        return _show_frame(asset_keys[0])
+    return orjson.dumps({"show": asset_keys}).decode()
+
+
+def _frames(items: list) -> list[str]:
+    """
+    Turns a drained queue into WebSocket messages, in order. Runs of shows
+    go out as one {"show": [...]} message; each hide is its own message.
+    """
+    frames = []
+    run = []
+    for item in items:
+        if item is HIDE:
+            if run:
+                frames.append(_show_message(run))
+                run = []
+            frames.append(_HIDE_FRAME)
+        else:
+            run.append(item)
+    if run:
+        frames.append(_show_message(run))
+    return frames
+
+
 class VisualChannel:
     """
     Registry of active WebSocket connections.
     Shared between backend.py (which registers connections)
     and agent.py (which sends signals).
+
+    Each connection gets a send queue drained by its own writer task, so
+    send_show and send_hide never block the caller, and tags that pile up
+    while a send is in flight go out together as one {"show": [...]}
+    message. Messages are encoded with orjson and sent as text.
     """
+    __slots__ = ("_connections", "_queues", "_writers")
+
     def __init__(self):
         self._connections: dict = {}
+        self._queues: dict[str, asyncio.Queue] = {}
+        self._writers: dict[str, asyncio.Task] = {}
 
     def register(self, session_id: str, websocket):
+        writer = self._writers.get(session_id)
+        if writer is not None:
+            writer.cancel()
+        queue = asyncio.Queue()
         self._connections[session_id] = websocket
+        self._queues[session_id] = queue
+        self._writers[session_id] = asyncio.create_task(
+            self._writer(session_id, websocket, queue)
+        )
         logger.info(f"Visual channel registered: {session_id}")
 
     def unregister(self, session_id: str):
-        if session_id in self._connections:
-            del self._connections[session_id]
+        if self._connections.pop(session_id, None) is not None:
+            del self._queues[session_id]
+            self._writers.pop(session_id).cancel()
             logger.info(f"Visual channel unregistered: {session_id}")
 
-    async def send_show(self, session_id: str, asset_key: str):
-        ws = self._connections.get(session_id)
-        if ws:
-            try:
-                await ws.send_json({"show": asset_key})
-                logger.debug(f"Visual signal sent: {asset_key} → {session_id}")
-            except Exception as e:
-                logger.warning(f"Failed to send visual signal: {e}")
-                self.unregister(session_id)
+    def send_show(self, session_id: str, asset_key: str):
+        """Queues an asset for the browser. Never waits on the socket."""
+        queue = self._queues.get(session_id)
+        if queue is not None:
+            queue.put_nowait(asset_key)
 
-    async def send_hide(self, session_id: str):
-        ws = self._connections.get(session_id)
-        if ws:
+    def send_hide(self, session_id: str):
+        """Queues a hide after any shows still waiting to go out."""
+        queue = self._queues.get(session_id)
+        if queue is not None:
+            queue.put_nowait(HIDE)
+
+    async def _writer(self, session_id: str, ws, queue: asyncio.Queue):
+        while True:
+            items = [await queue.get()]
+            while not queue.empty():
+                items.append(queue.get_nowait())
             try:
-                await ws.send_json({"hide": True})
+                for frame in _frames(items):
+                    await ws.send_text(frame)
+                logger.debug("Visual signals sent: {} → {}", items, session_id)
             except Exception as e:
-                logger.warning(f"Failed to send hide signal: {e}")
+                logger.warning(f"Failed to send visual signal: {e}")
+                if self._connections.get(session_id) is ws:
+                    self.unregister(session_id)
+                return
 
 
 # Global instance — imported by both backend.py and agent.py